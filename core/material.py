@@ -5,11 +5,14 @@ based on the semantics of the CityJSON file.
 """
 
 import bpy
-from .utils import assign_properties, clean_list
+from .utils import assign_properties, flatten_semantics
 
 class BasicMaterialFactory:
     """A factory that creates a simple material for every city object"""
 
+    # Materials depend on every geometry's semantics
+    per_object = False
+
     material_colors = {
         "WallSurface": (0.8, 0.8, 0.8, 1),
         "RoofSurface": (0.9, 0.057, 0.086, 1),
@@ -53,7 +56,13 @@ class BasicMaterialFactory:
             for surface in geometry['semantics']['surfaces']:
                 mats.append(self.get_material(surface))
 
-            values = clean_list(values)
+            values = flatten_semantics(values, geometry)
+
+            # Faces without semantics get an empty material slot
+            if None in values:
+                values = [len(mats) if value is None else value
+                          for value in values]
+                mats.append(None)
 
         return (mats, values)
 
@@ -98,6 +107,12 @@ class CityObjectTypeMaterialFactory:
 
     default_color = (0.3, 0.3, 0.3, 1)
 
+    # Materials depend only on the city object, not its geometries
+    per_object = True
+
+    def __init__(self):
+        self.type_materials = {}
+
     def create_material(self, name, color):
         """Returns a new material based on the semantic surface of the object"""
         mat = bpy.data.materials.new(name=name)
@@ -130,5 +145,10 @@ class CityObjectTypeMaterialFactory:
         geometry
         """
 
-        return ([self.get_material(cityobject['type'])],
-                [])
+        object_type = cityobject['type']
+
+        if object_type not in self.type_materials:
+            self.type_materials[object_type] = ([self.get_material(object_type)],
+                                                [])
+
+        return self.type_materials[object_type]
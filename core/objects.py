@@ -2,12 +2,20 @@
 
 import json
 import time
+from collections import defaultdict, namedtuple
+from itertools import accumulate
 
 import bpy
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from .material import (BasicMaterialFactory, ReuseMaterialFactory,
                        CityObjectTypeMaterialFactory)
-from .utils import (assign_properties, clean_buffer, clean_list,
+from .utils import (assign_properties, clean_buffer,
                     coord_translate_axis_origin, remove_scene_objects)
 
 
@@ -18,6 +26,33 @@ def get_geometry_name(objid, geom, index):
     else:
         return "{index}: [GeometryInstance] {name}".format(name=objid, index=index)
 
+def _extract_surface(boundaries):
+    """Returns the faces of a MultiSurface or CompositeSurface"""
+
+    return [face[0] for face in boundaries if face]
+
+def _extract_solid(boundaries):
+    """Returns the faces of a Solid"""
+
+    return [face[0]
+            for shell in boundaries
+            for face in shell if face]
+
+def _extract_multisolid(boundaries):
+    """Returns the faces of a MultiSolid"""
+
+    return [face[0]
+            for solid in boundaries
+            for shell in solid
+            for face in shell if face]
+
+_GEOM_EXTRACTORS = {
+    'MultiSurface': _extract_surface,
+    'CompositeSurface': _extract_surface,
+    'Solid': _extract_solid,
+    'MultiSolid': _extract_multisolid,
+}
+
 def create_empty_object(name):
     """Returns an empty blender object"""
 
@@ -25,46 +60,123 @@ def create_empty_object(name):
 
     return new_object
 
-def create_mesh_object(name, vertices, faces, materials=[], material_indices=[]):
-    """Returns a mesh blender object"""
+MeshArrays = namedtuple('MeshArrays',
+                        ['coords', 'indices', 'loop_starts', 'loop_totals',
+                         'degenerate_faces'])
 
-    mesh_data = None
+def remove_repeated_vertices(bound):
+    """Returns the rings without consecutive or closing repeated vertices
 
-    if faces:
-        mesh_data = bpy.data.meshes.new(name)
+    Also returns the positions of the rings that still use a vertex more than
+    once and the number of rings left with less than three vertices
+    """
+    rings = []
+    repeated = []
+    degenerate = 0
 
-        for material in materials:
-            mesh_data.materials.append(material)
+    for ring in bound:
+        if len(set(ring)) != len(ring):
+            ring = [vertex for i, vertex in enumerate(ring)
+                    if vertex != ring[i - 1]] or ring[:1]
+
+            if len(set(ring)) != len(ring):
+                repeated.append(len(rings))
+
+        if len(ring) < 3:
+            degenerate += 1
+
+        rings.append(ring)
+
+    return rings, repeated, degenerate
+
+def split_repeated_corners(vertices, indices, loop_starts, loop_totals, faces):
+    """Gives every corner repeated within one of the provided faces a vertex
+    of its own, so the polygon stays valid
+
+    The indices are updated in place and the vertices are returned with the
+    copies appended
+    """
+    copies = []
+
+    for face in faces:
+        start = loop_starts[face]
+        used = set()
+
+        for loop in range(start, start + loop_totals[face]):
+            vertex_id = int(indices[loop])
+
+            if vertex_id in used:
+                indices[loop] = len(vertices) + len(copies)
+                copies.append(vertex_id)
+            else:
+                used.add(vertex_id)
+
+    if copies:
+        vertices = np.concatenate((vertices, vertices.take(copies, axis=0)))
+
+    return vertices
+
+def build_mesh_arrays(vertices, geom):
+    """Returns the buffers needed to create a mesh for the provided geometry"""
+    # Checking how nested the geometry is i.e what kind of 3D
+    # geometry it contains
+    extractor = _GEOM_EXTRACTORS.get(geom['type'])
+    bound = extractor(geom['boundaries']) if extractor else []
+
+    # Vertices are shared between faces, so a ring repeating a vertex would
+    # make an invalid polygon
+    bound, repeated, degenerate = remove_repeated_vertices(bound)
+
+    temp_vertices, indices, sizes = clean_buffer(vertices, bound)
 
-        indices = [i for face in faces for i in face]
+    indices = np.asarray(indices, dtype=np.int32)
+    loop_totals = np.asarray(sizes, dtype=np.int32)
+    loop_starts = np.array([0, *accumulate(sizes)][:-1], dtype=np.int32)
 
-        mesh_data.vertices.add(len(vertices))
-        mesh_data.loops.add(len(indices))
-        mesh_data.polygons.add(len(faces))
+    if repeated:
+        temp_vertices = split_repeated_corners(temp_vertices, indices,
+                                               loop_starts, loop_totals,
+                                               repeated)
 
-        coords = [c for v in vertices for c in v]
+    coords = temp_vertices.astype(np.float32).ravel()
 
-        loop_totals = [len(face) for face in faces]
-        loop_starts = []
-        i = 0
-        for face in faces:
-            loop_starts.append(i)
-            i += len(face)
+    return MeshArrays(coords, indices, loop_starts, loop_totals, degenerate)
 
-        mesh_data.vertices.foreach_set("co", coords)
-        mesh_data.loops.foreach_set("vertex_index", indices)
-        mesh_data.polygons.foreach_set("loop_start", loop_starts)
-        mesh_data.polygons.foreach_set("loop_total", loop_totals)
-        if len(material_indices) == len(faces):
-            mesh_data.polygons.foreach_set("material_index", material_indices)
-        elif len(material_indices) > len(faces):
+def create_mesh_object(name, arrays, materials=[], material_indices=[]):
+    """Returns a mesh blender object
+
+    The mesh is not updated, so its edges have to be calculated by the caller
+    once all the meshes have been created
+    """
+
+    mesh_data = None
+    num_faces = len(arrays.loop_totals)
+
+    if num_faces:
+        mesh_data = bpy.data.meshes.new(name)
+
+        for material in materials:
+            mesh_data.materials.append(material)
+
+        mesh_data.vertices.add(len(arrays.coords) // 3)
+        mesh_data.loops.add(len(arrays.indices))
+        mesh_data.polygons.add(num_faces)
+
+        mesh_data.vertices.foreach_set("co", arrays.coords)
+        mesh_data.loops.foreach_set("vertex_index", arrays.indices)
+        mesh_data.polygons.foreach_set("loop_start", arrays.loop_starts)
+        mesh_data.polygons.foreach_set("loop_total", arrays.loop_totals)
+        if len(material_indices) == num_faces:
+            mesh_data.polygons.foreach_set("material_index",
+                                           np.fromiter(material_indices,
+                                                       dtype=np.int32,
+                                                       count=num_faces))
+        elif len(material_indices) > num_faces:
             print("Object {name} has {num_faces} faces but {num_surfaces} semantic surfaces!"
                   .format(name=name,
-                          num_faces=len(faces),
+                          num_faces=num_faces,
                           num_surfaces=len(material_indices)))
 
-        mesh_data.update()
-
     new_object = bpy.data.objects.new(name, mesh_data)
 
     return new_object
@@ -88,7 +200,7 @@ class CityJSONParser:
         self.clear_scene = clear_scene
 
         self.data = {}
-        self.vertices = []
+        self.vertices = np.empty((0, 3), dtype=np.float64)
 
         if material_type == 'SURFACES':
             if reuse_materials:
@@ -101,31 +213,26 @@ class CityJSONParser:
     def load_data(self):
         """Loads the CityJSON data from the file"""
 
-        with open(self.filepath) as json_file:
-            self.data = json.load(json_file)
+        if orjson is not None:
+            with open(self.filepath, 'rb') as json_file:
+                self.data = orjson.loads(json_file.read())
+        else:
+            with open(self.filepath) as json_file:
+                self.data = json.load(json_file)
 
     def prepare_vertices(self):
         """Prepares the vertices by applying any required transformations"""
 
-        vertices = []
+        vertices = np.asarray(self.data['vertices'],
+                              dtype=np.float64).reshape(-1, 3)
 
         # Checking if coordinates need to be transformed and
         # transforming if necessary
-        if 'transform' not in self.data:
-            for vertex in self.data['vertices']:
-                vertices.append(tuple(vertex))
-        else:
+        if 'transform' in self.data:
             trans_param = self.data['transform']
             # Transforming coords to actual real world coords
-            for vertex in self.data['vertices']:
-                x = vertex[0]*trans_param['scale'][0] \
-                    + trans_param['translate'][0]
-                y = vertex[1]*trans_param['scale'][1] \
-                    + trans_param['translate'][1]
-                z = vertex[2]*trans_param['scale'][2] \
-                    + trans_param['translate'][2]
-
-                vertices.append((x, y, z))
+            vertices *= np.asarray(trans_param['scale'], dtype=np.float64)
+            vertices += np.asarray(trans_param['translate'], dtype=np.float64)
 
         # Translating coordinates to the axis origin
         translation = coord_translate_axis_origin(vertices)
@@ -133,37 +240,19 @@ class CityJSONParser:
         # Updating vertices with new translated vertices
         self.vertices = translation[0]
 
-    def parse_geometry(self, theid, obj, geom, index):
-        """Returns a mesh object for the provided geometry"""
-        bound = []
-
-        # Checking how nested the geometry is i.e what kind of 3D
-        # geometry it contains
-        if (geom['type'] == 'MultiSurface'
-                or geom['type'] == 'CompositeSurface'):
-            for face in geom['boundaries']:
-                if face:
-                    bound.append(tuple(face[0]))
-        elif geom['type'] == 'Solid':
-            for shell in geom['boundaries']:
-                for face in shell:
-                    if face:
-                        bound.append(tuple(face[0]))
-        elif geom['type'] == 'MultiSolid':
-            for solid in geom['boundaries']:
-                for shell in solid:
-                    for face in shell:
-                        if face:
-                            bound.append(tuple(face[0]))
-
-        temp_vertices, temp_bound = clean_buffer(self.vertices, bound)
-
-        mats, values = self.material_factory.get_materials(cityobject=obj,
-                                                           geometry=geom)
+    def parse_geometry(self, theid, obj, geom, index, arrays, materials=None):
+        """Returns a mesh object for the provided geometry and its buffers
+
+        The materials of the city object can be provided when they don't
+        depend on the geometry
+        """
+        if materials is None:
+            materials = self.material_factory.get_materials(cityobject=obj,
+                                                            geometry=geom)
+        mats, values = materials
 
         geom_obj = create_mesh_object(get_geometry_name(theid, geom, index),
-                                      temp_vertices,
-                                      temp_bound,
+                                      arrays,
                                       mats,
                                       values)
 
@@ -184,58 +273,85 @@ class CityJSONParser:
 
         self.prepare_vertices()
 
-        new_objects = []
+        # New objects grouped by the name of the collection they belong to,
+        # None standing for the scene's collection
+        new_objects = defaultdict(list)
         cityobjs = {}
+        parent_edges = []
+        meshes = []
+
+        items = list(self.data['CityObjects'].items())
 
-        progress_max = len(self.data['CityObjects'])
+        progress_max = len(items)
         progress = 0
         start_import = time.time()
 
         # Creating empty meshes for every CityObjects and linking its
         # geometries as children-meshes
-        for objid, obj in self.data['CityObjects'].items():
+        for objid, obj in items:
             cityobject = create_empty_object(objid)
             cityobject = assign_properties(cityobject,
                                            obj)
-            new_objects.append(cityobject)
+            new_objects[None].append(cityobject)
             cityobjs[objid] = cityobject
 
+            if obj.get('parents'):
+                parent_edges.append((objid, obj['parents'][0]))
+
+            materials = None
+            if self.material_factory.per_object and obj['geometry']:
+                materials = self.material_factory.get_materials(cityobject=obj)
+
             for i, geom in enumerate(obj['geometry']):
-                geom_obj = self.parse_geometry(objid, obj, geom, i)
+                arrays = build_mesh_arrays(self.vertices, geom)
+                geom_obj = self.parse_geometry(objid, obj, geom, i, arrays,
+                                               materials)
                 geom_obj.parent = cityobject
-                new_objects.append(geom_obj)
+
+                if geom_obj.data is not None:
+                    meshes.append((geom_obj.data, arrays.degenerate_faces))
+
+                if 'lod' in geom:
+                    new_objects["LoD{}".format(geom['lod'])].append(geom_obj)
+                else:
+                    new_objects[None].append(geom_obj)
 
             progress += 1
             print("Importing: {percent}% completed"
                   .format(percent=round(progress * 100 / progress_max, 1)),
                   end="\r")
+
+        # Removing degenerate faces and calculating edges and normals now that
+        # all meshes are filled in
+        for mesh, degenerate_faces in meshes:
+            if degenerate_faces:
+                print("Mesh {name} has {num_faces} faces with less than three"
+                      " vertices, removing them!"
+                      .format(name=mesh.name, num_faces=degenerate_faces))
+                mesh.validate()
+
+            mesh.update(calc_edges=True)
         end_import = time.time()
 
-        progress = 0
         start_hier = time.time()
 
         #Assigning child building parts to parent buildings
-        for objid, obj in self.data['CityObjects'].items():
-            if 'parents' in obj:
-                parent_id = obj['parents'][0]
-                cityobjs[objid].parent = cityobjs[parent_id]
-
-            progress += 1
-            print("Building hierarchy: {percent}% completed"
-                  .format(percent=round(progress * 100 / progress_max, 1)),
-                  end="\r")
+        for objid, parent_id in parent_edges:
+            cityobjs[objid].parent = cityobjs[parent_id]
         end_hier = time.time()
 
         start_link = time.time()
 
         # Link everything to the scene
-        collection = bpy.context.scene.collection
-        for new_object in new_objects:
-            if 'lod' in new_object:
-                get_collection("LoD{}".format(new_object['lod'])).objects.link(new_object)
+        for collection_name, objects in new_objects.items():
+            if collection_name is None:
+                collection = bpy.context.scene.collection
             else:
-                collection.objects.link(new_object)
+                collection = get_collection(collection_name)
 
+            link = collection.objects.link
+            for new_object in objects:
+                link(new_object)
 
         end_link = time.time()
 
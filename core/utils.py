@@ -4,28 +4,62 @@ This modules provides utitily methods for the importing/exporting
 processing of CityJSON files
 """
 
+from itertools import chain
+
 import bpy
+import numpy as np
 
 def remove_scene_objects():
-    """Clears the scenes of any objects"""
+    """Clears the scenes of any objects
+
+    Every object of the current scene is removed from the whole file,
+    including hidden and unselectable ones and those also linked to other
+    scenes, like the collections that get removed afterwards
+    """
+
+    # Deleting previous objects every time a new CityJSON file is imported.
+    # Removing them from bpy.data directly avoids the context, undo and
+    # redraw overhead of the delete operator
+    meshes = set()
+    for obj in list(bpy.context.scene.objects):
+        if obj.type == 'MESH':
+            meshes.add(obj.data)
 
-    # Deleting previous objects every time a new CityJSON file is imported
-    bpy.ops.object.select_all(action='SELECT')
-    bpy.ops.object.delete()
+        bpy.data.objects.remove(obj, do_unlink=True)
+
+    # Deleting the meshes of the removed objects that are no longer used
+    for mesh in meshes:
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
 
     # Deleting previously existing collections
     for collection in bpy.data.collections:
         bpy.data.collections.remove(collection)
 
-def clean_list(values):
-    """Creates a list of non list in case lists nested in lists exist"""
+# How many levels of lists wrap the semantic values of every geometry type
+SEMANTICS_DEPTH = {
+    'MultiSurface': 0,
+    'CompositeSurface': 0,
+    'Solid': 1,
+    'MultiSolid': 2,
+}
+
+def flatten_semantics(values, geometry):
+    """Returns the semantic values of a geometry as a flat list
 
-    while isinstance(values[0], list):
-        values = values[0]
+    A null shell or solid is expanded into a null value for each of its faces
+    """
+    boundaries = geometry['boundaries']
+
+    for _ in range(SEMANTICS_DEPTH.get(geometry['type'], 0)):
+        values = list(chain.from_iterable(
+            [None] * len(boundary) if value is None else value
+            for value, boundary in zip(values, boundaries)))
+        boundaries = list(chain.from_iterable(boundaries))
 
     return values
 
-def assign_properties(obj, props, prefix=[]):
+def assign_properties(obj, props, prefix=()):
     """Assigns the custom properties to obj based on the props"""
 
     for prop, value in props.items():
@@ -34,54 +68,61 @@ def assign_properties(obj, props, prefix=[]):
             continue
 
         if isinstance(value, dict):
-            obj = assign_properties(obj, value, prefix + [prop])
+            obj = assign_properties(obj, value, prefix + (prop,))
 
         else:
-            obj[".".join(prefix + [prop])] = value
+            obj[".".join(prefix + (prop,))] = value
 
     return obj
 
 def coord_translate_axis_origin(vertices):
-    """Translates the vertices to the origin (0, 0, 0)"""
+    """Translates the vertices to the origin (0, 0, 0)
+
+    The vertices can be any (N, 3) sequence. A float64 array is translated in
+    place, anything else is converted to one first.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+
     #Finding minimum value of x,y,z
-    minx = min(i[0] for i in vertices)
-    miny = min(i[1] for i in vertices)
-    minz = min(i[2] for i in vertices)
+    mins = vertices.min(axis=0)
 
     #Calculating new coordinates
-    translated_x = [i[0]-minx for i in vertices]
-    translated_y = [i[1]-miny for i in vertices]
-    translated_z = [i[2]-minz for i in vertices]
+    vertices -= mins
 
-    return (tuple(zip(translated_x, translated_y, translated_z)),
-            minx,
-            miny,
-            minz)
+    return (vertices,
+            mins[0],
+            mins[1],
+            mins[2])
 
 
 def original_coordinates(vertices, minx, miny, minz):
     """Translates the vertices from origin to original"""
     #Calculating original coordinates
-    original_x = [i[0]+minx for i in vertices]
-    original_y = [i[1]+miny for i in vertices]
-    original_z = [i[2]+minz for i in vertices]
+    return np.asarray(vertices, dtype=np.float64) + (minx, miny, minz)
 
-    return tuple(zip(original_x, original_y, original_z))
+# Under this many indices remapping them in Python is faster than the fixed
+# cost of np.unique
+UNIQUE_MIN_INDICES = 600
 
 def clean_buffer(vertices, bounds):
-    """Cleans the vertices index from unused vertices3"""
+    """Cleans the vertices index from unused vertices
+
+    Returns only the vertices referenced by the bounds, each of them once, as
+    an (N, 3) array, together with the flattened bounds re-indexed against it
+    and the size of every bound.
+    """
 
-    new_bounds = list()
-    new_vertices = list()
-    i = 0
-    for bound in bounds:
-        new_bound = list()
+    vertices = np.asarray(vertices)
 
-        for vertex_id in bound:
-            new_vertices.append(vertices[vertex_id])
-            new_bound.append(i)
-            i = i + 1
+    sizes = [len(bound) for bound in bounds]
+    flat = list(chain.from_iterable(bounds))
 
-        new_bounds.append(tuple(new_bound))
+    if len(flat) < UNIQUE_MIN_INDICES:
+        remap = {}
+        new_ids = [remap.setdefault(vertex_id, len(remap))
+                   for vertex_id in flat]
+        unique_ids = list(remap)
+    else:
+        unique_ids, new_ids = np.unique(flat, return_inverse=True)
 
-    return new_vertices, new_bounds
+    return vertices.take(unique_ids, axis=0), new_ids, sizes